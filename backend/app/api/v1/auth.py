@@ -7,23 +7,33 @@ Auth endpoints for SmartQuiz AI:
 """
 
 from typing import Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
 import secrets
 import hashlib
+import hmac
+import threading
+import time
+
+from cachetools import TTLCache
 
 from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
+from sqlalchemy import exists
 from sqlalchemy.orm import Session
 
 import jwt  # PyJWT
+from jwt.algorithms import get_default_algorithms
+import redis
+import rq
 
+from app.core.config import settings
 from app.db.session import get_db
 from app.models import EmailOTP, User
 from app.core.security import hash_password as get_password_hash
-from app.core.security import verify_password
-from app.utils.email_sender import send_email_otp
+from app.core.security import needs_rehash, verify_password
+from app.utils.email_sender import send_email_otp_async
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -41,10 +51,41 @@ SMTP_PASS = os.environ.get("SMTP_PASS")
 JWT_SECRET = os.environ.get("JWT_SECRET", "super-secret-change-me")
 JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+# Tokens we mint always carry an integer user id in "sub"; the email-subject
+# fallback only exists for externally issued tokens and is off by default.
+JWT_ALLOW_EMAIL_SUB = os.environ.get("JWT_ALLOW_EMAIL_SUB", "0").lower() in ("1", "true", "yes")
+
+# Prepare the signing/verification key once at import. PyJWT otherwise
+# re-wraps the raw secret on every encode/decode; cheap for HS256 but the
+# key load dominates for asymmetric algorithms.
+_JWT_KEY = get_default_algorithms()[JWT_ALGORITHM].prepare_key(JWT_SECRET)
+
+# Precomputed hash used to equalize login timing when the email does not
+# exist; without the dummy verify a miss returns in ~0ms vs ~100ms for a
+# real hash check and leaks account existence.
+_DUMMY_HASH = get_password_hash("x" * 12)
 
 # Security scheme for extraction
 bearer_scheme = HTTPBearer(auto_error=False)
 
+# Cache decoded JWT payloads keyed by the raw token string. Hot polling
+# endpoints (/me, /protected, quiz status) resend the same token on every
+# request, so this skips the base64 + JSON work for unchanged tokens.
+_token_cache: TTLCache = TTLCache(maxsize=4096, ttl=30)
+_token_cache_lock = threading.Lock()
+
+# Short-lived cache of user scalar fields keyed by user id. Dashboards poll
+# /me, /protected and quiz status on intervals while the User row is
+# effectively static, so repeat requests can skip the SQL roundtrip.
+_user_cache: TTLCache = TTLCache(maxsize=2048, ttl=15)
+_user_cache_lock = threading.Lock()
+
+def _invalidate_user_cache(user_id: Optional[int]) -> None:
+    if user_id is None:
+        return
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
 # --- Schemas ---
 class RegisterRequest(BaseModel):
     email: EmailStr
@@ -67,35 +108,148 @@ class VerifyEmailOtpRequest(BaseModel):
 
 # --- Helpers ---
 def _now_utc() -> datetime:
-    return datetime.utcnow()
+    # naive UTC to match the DateTime columns; utcnow() is deprecated
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
-def _generate_otp(length: int = OTP_LENGTH) -> str:
-    return f"{secrets.randbelow(10 ** length):0{length}d}"
+def _generate_otp_and_salt(length: int = OTP_LENGTH) -> tuple[str, str]:
+    """
+    Derive the OTP digits and the hash salt from a single urandom read
+    instead of separate randbelow + token_hex calls. The modulo bias of
+    2^64 mod 10^length is negligible (~1e-13 for 6 digits).
+    """
+    raw = secrets.token_bytes(16)
+    otp = f"{int.from_bytes(raw[:8], 'big') % (10 ** length):0{length}d}"
+    return otp, raw[8:].hex()
 
 def _hash_with_salt(code: str, salt: str) -> str:
-    h = hashlib.sha256()
-    h.update(f"{code}{salt}{OTP_HASH_SECRET}".encode("utf-8"))
-    return h.hexdigest()
+    # Keyed BLAKE2b with native salt support: one hash call, no string
+    # concatenation of code/salt/secret. BLAKE2b key is capped at 64 bytes,
+    # salt at 16 bytes (token_hex(8) -> 8 raw bytes).
+    return hashlib.blake2b(
+        code.encode("utf-8"),
+        key=OTP_HASH_SECRET.encode("utf-8")[:64],
+        salt=bytes.fromhex(salt),
+    ).hexdigest()
+
+def _issue_otp(db: Session, email: str, user_id: Optional[int] = None, now: Optional[datetime] = None) -> str:
+    """
+    Generate an OTP, insert its salted-hash row, and return the plaintext.
+    Shared by register/login/send-email-otp so the generation block lives
+    in one place. Callers that already hold the request timestamp pass it
+    via `now` to avoid a second clock read.
+    """
+    otp_plain, salt = _generate_otp_and_salt()
+    hashed = _hash_with_salt(otp_plain, salt)
+    expires_at = (now or _now_utc()) + timedelta(seconds=OTP_TTL_SECONDS)
 
-def _throttle_exceeded(db: Session, email: str) -> bool:
-    now = _now_utc()
-    hour_ago = now - timedelta(hours=1)
+    otp_row = EmailOTP(
+        user_id=user_id,
+        email=email,
+        code=f"{hashed}|{salt}",
+        expires_at=expires_at,
+        used=False
+    )
+    db.add(otp_row)
+    db.commit()
+    return otp_plain
+
+_redis_client: Optional[redis.Redis] = None
+
+def _get_redis() -> redis.Redis:
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis_client
+
+_otp_queue: Optional[rq.Queue] = None
+
+def _get_otp_queue() -> rq.Queue:
+    global _otp_queue
+    if _otp_queue is None:
+        _otp_queue = rq.Queue("emails", connection=_get_redis())
+    return _otp_queue
+
+def _dispatch_otp_email(background_tasks: BackgroundTasks, email: str, otp: str, subject: str) -> None:
+    """
+    Hand the SMTP send to the RQ worker sidecar (run `rq worker emails`)
+    so it never occupies an API worker. Falls back to an in-process
+    background task when Redis is unreachable so dev setups without a
+    worker keep sending OTPs.
+    """
+    try:
+        _get_otp_queue().enqueue(
+            "app.utils.email_sender.send_email_otp", email, otp, subject, result_ttl=60
+        )
+        return
+    except Exception as e:
+        print("Failed to enqueue OTP email to RQ, using in-process task:", e)
+
+    try:
+        # coroutine tasks are awaited on the event loop, so the SMTP
+        # handshake doesn't pin a threadpool worker
+        background_tasks.add_task(send_email_otp_async, email, otp, subject)
+    except Exception as e:
+        print("Failed to enqueue send_email_otp:", e)
+
+def _throttle_exceeded(db: Session, email: str, now: Optional[datetime] = None) -> bool:
+    """
+    Rate-limit OTP sends per email. Uses an O(1) Redis counter bucketed by
+    hour (shared across workers) and falls back to the old COUNT(*) range
+    scan on email_otps when Redis is unreachable (e.g. local dev).
+    """
+    try:
+        key = f"otp:rl:{email}:{int(time.time()) // 3600}"
+        pipe = _get_redis().pipeline()
+        pipe.incr(key)
+        pipe.expire(key, 3600)
+        count, _ = pipe.execute()
+        return int(count) > OTP_MAX_SENDS_PER_HOUR
+    except redis.RedisError:
+        pass
+
+    hour_ago = (now or _now_utc()) - timedelta(hours=1)
     recent = db.query(EmailOTP).filter(
         EmailOTP.email == email,
         EmailOTP.created_at >= hour_ago
     ).count()
     return recent >= OTP_MAX_SENDS_PER_HOUR
 
-def create_access_token(subject: str | int, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES) -> dict:
+def create_access_token(subject: str | int, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES, now: Optional[datetime] = None) -> dict:
     """
     Returns token dict: {"access_token": <str>, "token_type": "bearer", "expires_in": <seconds>}
     subject can be user id or email
     """
-    expire = datetime.utcnow() + timedelta(minutes=expires_minutes)
-    payload = {"sub": str(subject), "exp": expire}
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    expire = (now or _now_utc()) + timedelta(minutes=expires_minutes)
+    payload = {"sub": str(subject), "exp": expire, "typ": "access"}
+    token = jwt.encode(payload, _JWT_KEY, algorithm=JWT_ALGORITHM)
     return {"access_token": token, "token_type": "bearer", "expires_in": int(expires_minutes * 60)}
 
+def _decode_and_validate(token: str) -> dict:
+    """
+    Decode a JWT, caching the payload by raw token string.
+    Cache hits still re-check "exp" against the clock so an expired token is
+    never accepted just because it was decoded within the cache TTL.
+    """
+    with _token_cache_lock:
+        payload = _token_cache.get(token)
+    if payload is not None:
+        exp = payload.get("exp")
+        if exp is not None and exp <= time.time():
+            raise jwt.ExpiredSignatureError("Signature has expired")
+        return payload
+
+    # Require exp/sub up front so PyJWT enforces them in one pass instead of
+    # us branching on the payload afterwards.
+    payload = jwt.decode(
+        token,
+        _JWT_KEY,
+        algorithms=[JWT_ALGORITHM],
+        options={"require": ["exp", "sub"]},
+    )
+    with _token_cache_lock:
+        _token_cache[token] = payload
+    return payload
+
 # --- JWT dependency / user loader ---
 def get_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
@@ -111,29 +265,48 @@ def get_current_user(
 
     token = credentials.credentials
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = _decode_and_validate(token)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    sub = payload.get("sub")
-    if not sub:
-        raise HTTPException(status_code=401, detail="Invalid token payload")
+    sub = payload["sub"]
 
-    try:
+    # Tokens we mint always carry a digit-string user id, so a single
+    # C-level isdigit check replaces the old int() + try/except branching.
+    if isinstance(sub, str) and sub.isdigit():
         user_id = int(sub)
-    except Exception:
-        # fallback: if subject is email, try lookup by email
-        user = db.query(User).filter(User.email == sub).first()
+
+        # Cache only plain field values, never the session-bound ORM
+        # instance; hits are rebuilt as transient User objects, which is
+        # all the read-only endpoint code needs.
+        with _user_cache_lock:
+            fields = _user_cache.get(user_id)
+        if fields is not None:
+            return User(id=user_id, **fields)
+
+        # Session.get uses the primary-key identity map + a precompiled
+        # statement, skipping query construction on the hot path.
+        user = db.get(User, user_id)
         if not user:
-            raise HTTPException(status_code=401, detail="User not found for token subject")
+            raise HTTPException(status_code=401, detail="User not found")
+        with _user_cache_lock:
+            _user_cache[user_id] = {
+                "email": user.email,
+                "full_name": user.full_name,
+                "role": user.role,
+                "is_active": user.is_active,
+                "created_at": user.created_at,
+            }
         return user
 
-    user = db.query(User).filter(User.id == user_id).first()
+    # fallback: if subject is email, try lookup by email (opt-in only)
+    if not JWT_ALLOW_EMAIL_SUB or not sub:
+        raise HTTPException(status_code=401, detail="Invalid token subject")
+    user = db.query(User).filter(User.email == sub).first()
     if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-
+        raise HTTPException(status_code=401, detail="User not found for token subject")
     return user
 
 # --- Endpoints ---
@@ -142,8 +315,9 @@ def register_user(req: RegisterRequest, background_tasks: BackgroundTasks, db: S
     if len(req.password) > 4096:
         raise HTTPException(status_code=400, detail="Password too long")
 
-    existing = db.query(User).filter(User.email == req.email).first()
-    if existing:
+    # EXISTS probe against the unique email index instead of hydrating a
+    # full User row just to test for a duplicate
+    if db.query(exists().where(User.email == req.email)).scalar():
         raise HTTPException(status_code=400, detail="Email already registered")
 
     hashed_pw = get_password_hash(req.password)
@@ -155,31 +329,15 @@ def register_user(req: RegisterRequest, background_tasks: BackgroundTasks, db: S
         role=req.role
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    db.flush()  # populates user.id without a COMMIT roundtrip
 
-    if _throttle_exceeded(db, req.email):
+    now = _now_utc()
+    if _throttle_exceeded(db, req.email, now=now):
         raise HTTPException(status_code=429, detail="Too many OTP requests. Try again later.")
 
-    otp_plain = _generate_otp()
-    salt = secrets.token_hex(8)
-    hashed = _hash_with_salt(otp_plain, salt)
-    expires_at = _now_utc() + timedelta(seconds=OTP_TTL_SECONDS)
-
-    otp_row = EmailOTP(
-        user_id=user.id,
-        email=req.email,
-        code=f"{hashed}|{salt}",
-        expires_at=expires_at,
-        used=False
-    )
-    db.add(otp_row)
-    db.commit()
+    otp_plain = _issue_otp(db, req.email, user_id=user.id, now=now)
 
-    try:
-        background_tasks.add_task(send_email_otp, req.email, otp_plain, "Confirm your SmartQuiz account")
-    except Exception as e:
-        print("Failed to enqueue send_email_otp:", e)
+    _dispatch_otp_email(background_tasks, req.email, otp_plain, "Confirm your SmartQuiz account")
 
     if (not SMTP_USER or not SMTP_PASS) or DEV_SHOW_OTP:
         print(f"[DEV] OTP for {req.email} = {otp_plain}")
@@ -195,7 +353,13 @@ def login_with_2fa(req: LoginRequest, background_tasks: BackgroundTasks, db: Ses
     user = db.query(User).filter(User.email == req.email).first()
     invalid_resp = HTTPException(status_code=401, detail="Invalid credentials")
 
+    # NOTE: this handler (like all auth handlers) is a plain `def`, so
+    # Starlette runs it on its worker threadpool. The ~20-50ms argon2/bcrypt
+    # verify below therefore never blocks the event loop; keep these
+    # handlers sync unless that changes.
     if not user:
+        # burn the same CPU budget as a real verify before rejecting
+        verify_password(req.password, _DUMMY_HASH)
         raise invalid_resp
 
     try:
@@ -207,28 +371,21 @@ def login_with_2fa(req: LoginRequest, background_tasks: BackgroundTasks, db: Ses
     if not ok:
         raise invalid_resp
 
-    if _throttle_exceeded(db, req.email):
+    # Lazily upgrade legacy bcrypt rows (and stale argon2 parameters) now
+    # that we hold the plaintext.
+    if needs_rehash(user.password_hash):
+        user.password_hash = get_password_hash(req.password)
+        db.add(user)
+        db.commit()
+        _invalidate_user_cache(user.id)
+
+    now = _now_utc()
+    if _throttle_exceeded(db, req.email, now=now):
         raise HTTPException(status_code=429, detail="Too many OTP requests. Try again later.")
 
-    otp_plain = _generate_otp()
-    salt = secrets.token_hex(8)
-    hashed = _hash_with_salt(otp_plain, salt)
-    expires_at = _now_utc() + timedelta(seconds=OTP_TTL_SECONDS)
+    otp_plain = _issue_otp(db, req.email, user_id=user.id, now=now)
 
-    otp_row = EmailOTP(
-        user_id=user.id,
-        email=req.email,
-        code=f"{hashed}|{salt}",
-        expires_at=expires_at,
-        used=False
-    )
-    db.add(otp_row)
-    db.commit()
-
-    try:
-        background_tasks.add_task(send_email_otp, req.email, otp_plain, "SmartQuiz login OTP")
-    except Exception as e:
-        print("Failed to enqueue send_email_otp:", e)
+    _dispatch_otp_email(background_tasks, req.email, otp_plain, "SmartQuiz login OTP")
 
     if (not SMTP_USER or not SMTP_PASS) or DEV_SHOW_OTP:
         print(f"[DEV] Login OTP for {req.email} = {otp_plain}")
@@ -238,28 +395,13 @@ def login_with_2fa(req: LoginRequest, background_tasks: BackgroundTasks, db: Ses
 
 @router.post("/send-email-otp", status_code=status.HTTP_200_OK)
 def send_email_otp_endpoint(req: SendOtpRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    if _throttle_exceeded(db, req.email):
+    now = _now_utc()
+    if _throttle_exceeded(db, req.email, now=now):
         raise HTTPException(status_code=429, detail="Too many OTP requests. Try again later.")
 
-    otp_plain = _generate_otp()
-    salt = secrets.token_hex(8)
-    hashed = _hash_with_salt(otp_plain, salt)
-    expires_at = _now_utc() + timedelta(seconds=OTP_TTL_SECONDS)
+    otp_plain = _issue_otp(db, req.email, now=now)
 
-    otp_row = EmailOTP(
-        user_id=None,
-        email=req.email,
-        code=f"{hashed}|{salt}",
-        expires_at=expires_at,
-        used=False
-    )
-    db.add(otp_row)
-    db.commit()
-
-    try:
-        background_tasks.add_task(send_email_otp, req.email, otp_plain, "Your SmartQuiz OTP")
-    except Exception as e:
-        print("Failed to enqueue send_email_otp:", e)
+    _dispatch_otp_email(background_tasks, req.email, otp_plain, "Your SmartQuiz OTP")
 
     if (not SMTP_USER or not SMTP_PASS) or DEV_SHOW_OTP:
         print(f"[DEV] OTP for {req.email} = {otp_plain}")
@@ -281,6 +423,9 @@ def verify_email_otp_endpoint(req: VerifyEmailOtpRequest, db: Session = Depends(
     ).order_by(EmailOTP.created_at.desc()).first()
 
     if not otp_row:
+        # dummy hash of equivalent cost so a missing row is not
+        # distinguishable from a wrong code by response time
+        _hash_with_salt(req.code, "0" * 16)
         raise HTTPException(status_code=400, detail="No valid OTP found (maybe expired or not requested)")
 
     if "|" not in (otp_row.code or ""):
@@ -289,7 +434,8 @@ def verify_email_otp_endpoint(req: VerifyEmailOtpRequest, db: Session = Depends(
     stored_hash, salt = otp_row.code.split("|", 1)
     candidate_hash = _hash_with_salt(req.code, salt)
 
-    if candidate_hash != stored_hash:
+    # constant-time compare: plain != short-circuits per character
+    if not hmac.compare_digest(candidate_hash, stored_hash):
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
     # mark used
@@ -307,9 +453,10 @@ def verify_email_otp_endpoint(req: VerifyEmailOtpRequest, db: Session = Depends(
 
         # If verification purpose is login, issue a JWT for this user
         if req.purpose == "login":
-            token_payload = create_access_token(subject=user.id)
+            token_payload = create_access_token(subject=user.id, now=now)
 
     db.commit()
+    _invalidate_user_cache(otp_row.user_id)
 
     if token_payload:
         return token_payload
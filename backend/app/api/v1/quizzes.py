@@ -1,14 +1,22 @@
 # backend/app/api/v1/quizzes.py
 import os
-import glob
+import re
 import shutil
 import traceback
 from uuid import uuid4
 from typing import List, Optional, Any, Dict
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from datetime import datetime
 
+from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks, UploadFile, File, Form
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+import redis
+import rq
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.orm import Session, selectinload
+
+from app.core.config import settings
 from app.db.session import get_db, SessionLocal
 from app.models import Quiz, Question, User, QuizStatusEnum
 from app.schemas import QuizOut, QuizDetail
@@ -23,6 +31,58 @@ except Exception:
 
 router = APIRouter(prefix="/quizzes", tags=["quizzes"])
 
+# Reusable adapters validate a whole list (or nested detail) in one
+# pydantic-core call; going through response_model instead constructs and
+# validates every item separately.
+_QUIZ_LIST_ADAPTER = TypeAdapter(List[QuizOut])
+_QUIZ_DETAIL_ADAPTER = TypeAdapter(QuizDetail)
+
+
+def _adapter_response(adapter: TypeAdapter, obj: Any) -> ORJSONResponse:
+    validated = adapter.validate_python(obj, from_attributes=True)
+    return ORJSONResponse(adapter.dump_python(validated, mode="json"))
+
+# anything outside this set gets squashed to "_" in uploaded filenames
+_SAFE_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def _safe_filename(filename: Optional[str]) -> str:
+    """
+    Reduce a client-supplied filename to a safe basename: strip any path
+    components, replace unsafe characters in one regex pass, and bound the
+    length. The old '..' replace still allowed '/' and other traversal
+    characters through.
+    """
+    base = os.path.basename(filename or "file")
+    return _SAFE_RE.sub("_", base)[:128] or "upload.bin"
+
+
+def _save_upload(f: UploadFile, dest: str) -> None:
+    """
+    Persist an uploaded file to dest.
+    If the spooled upload has already spilled to a real file on disk, copy it
+    with os.sendfile (kernel-space, no Python-level chunk loop). Otherwise
+    fall back to copyfileobj with a 1 MiB buffer instead of the 16KB default.
+    """
+    f.file.seek(0)
+    if hasattr(os, "sendfile") and getattr(f.file, "_rolled", False):
+        in_fd = f.file.fileno()
+        out_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            size = os.fstat(in_fd).st_size
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+                if not sent:
+                    break
+                offset += sent
+        finally:
+            os.close(out_fd)
+        return
+
+    with open(dest, "wb") as out_f:
+        shutil.copyfileobj(f.file, out_f, length=1024 * 1024)
+
 
 def assert_teacher(user: User):
     if not user or getattr(user, "role", "").lower() != "teacher":
@@ -47,7 +107,7 @@ def _background_generate_quiz_from_files(quiz_id: int, files_paths: List[str], m
 
         if not generate_quiz_from_file:
             # generator not available — mark draft and return
-            quiz.status = QuizStatusEnum.draft
+            quiz.status = QuizStatusEnum.draft.value
             db.add(quiz)
             db.commit()
             print("[AI-Gen-file] generator-from-file not available.")
@@ -55,7 +115,7 @@ def _background_generate_quiz_from_files(quiz_id: int, files_paths: List[str], m
 
         # Use only the first uploaded file to match generator signature
         if not files_paths:
-            quiz.status = QuizStatusEnum.draft
+            quiz.status = QuizStatusEnum.draft.value
             db.add(quiz)
             db.commit()
             print(f"[AI-Gen-file] no files for quiz {quiz_id}")
@@ -87,14 +147,14 @@ def _background_generate_quiz_from_files(quiz_id: int, files_paths: List[str], m
                     model=metadata.get("model"),
                 )
             except Exception as e:
-                quiz.status = QuizStatusEnum.draft
+                quiz.status = QuizStatusEnum.draft.value
                 db.add(quiz)
                 db.commit()
                 print(f"[AI-Gen-file] generation FAILED on fallback: {e}")
                 traceback.print_exc()
                 return
         except Exception as e:
-            quiz.status = QuizStatusEnum.draft
+            quiz.status = QuizStatusEnum.draft.value
             db.add(quiz)
             db.commit()
             print(f"[AI-Gen-file] generation FAILED: {e}")
@@ -104,33 +164,36 @@ def _background_generate_quiz_from_files(quiz_id: int, files_paths: List[str], m
         # Validate output
         if not isinstance(questions, list):
             print(f"[AI-Gen-file] invalid generator output type for quiz {quiz_id} (expected list)")
-            quiz.status = QuizStatusEnum.draft
+            quiz.status = QuizStatusEnum.draft.value
             db.add(quiz)
             db.commit()
             return
 
-        # Save questions to DB
-        saved_count = 0
+        # Save questions to DB with one executemany instead of a roundtrip
+        # per row (20 questions -> 1 INSERT)
+        rows = []
         for q in questions:
             try:
-                question = Question(
-                    quiz_id=quiz.id,
-                    text=q.get("text") or q.get("question") or "",
-                    option_a=q.get("option_a") or q.get("a"),
-                    option_b=q.get("option_b") or q.get("b"),
-                    option_c=q.get("option_c") or q.get("c"),
-                    option_d=q.get("option_d") or q.get("d"),
-                    correct_option=(q.get("correct_option") or q.get("correct") or "a").lower(),
-                    explanation=q.get("explanation", ""),
-                    ai_generated=True,
-                )
-                db.add(question)
-                saved_count += 1
+                rows.append({
+                    "quiz_id": quiz.id,
+                    "text": q.get("text") or q.get("question") or "",
+                    "option_a": q.get("option_a") or q.get("a"),
+                    "option_b": q.get("option_b") or q.get("b"),
+                    "option_c": q.get("option_c") or q.get("c"),
+                    "option_d": q.get("option_d") or q.get("d"),
+                    "correct_option": (q.get("correct_option") or q.get("correct") or "a").lower(),
+                    "explanation": q.get("explanation", ""),
+                    "ai_generated": True,
+                })
             except Exception as e:
                 print(f"[AI-Gen-file] skip invalid question data: {e}")
                 continue
 
-        quiz.status = QuizStatusEnum.ready
+        saved_count = len(rows)
+        if rows:
+            db.execute(insert(Question), rows)
+
+        quiz.status = QuizStatusEnum.ready.value
         db.add(quiz)
         db.commit()
         print(f"[AI-Gen-file] SUCCESS: quiz {quiz_id} generated with {saved_count} questions.")
@@ -142,12 +205,90 @@ def _background_generate_quiz_from_files(quiz_id: int, files_paths: List[str], m
         db.close()
 
 
+_generation_queue: Optional[rq.Queue] = None
+
+
+def _get_generation_queue() -> rq.Queue:
+    global _generation_queue
+    if _generation_queue is None:
+        _generation_queue = rq.Queue(
+            "generation", connection=redis.Redis.from_url(settings.REDIS_URL)
+        )
+    return _generation_queue
+
+
+def _schedule_generation(background_tasks: BackgroundTasks, quiz_id: int, files_paths: List[str], metadata: dict) -> None:
+    """
+    Run generation on the RQ 'generation' queue (run `rq worker generation`
+    as a sidecar) so the multi-second PDF parse + LLM call never occupies an
+    API worker. Falls back to an in-process background task when Redis is
+    down; the quiz is already marked generating either way and clients poll
+    /status for completion.
+    """
+    try:
+        _get_generation_queue().enqueue(
+            "app.api.v1.quizzes._background_generate_quiz_from_files",
+            quiz_id,
+            files_paths,
+            metadata,
+            job_timeout=600,
+            result_ttl=60,
+        )
+        return
+    except Exception as e:
+        print(f"[AI-Gen-file] RQ enqueue failed ({e}); running in-process background task")
+
+    background_tasks.add_task(_background_generate_quiz_from_files, quiz_id, files_paths, metadata)
+
+
+def _attach_question_counts(db: Session, quizzes: List[Quiz]) -> List[Quiz]:
+    """
+    Annotate each quiz with question_count using one grouped COUNT query.
+    Iterating quiz.questions instead would lazy-load every collection —
+    the classic 1+N pattern.
+    """
+    if not quizzes:
+        return quizzes
+    counts = dict(
+        db.execute(
+            select(Question.quiz_id, func.count(Question.id))
+            .where(Question.quiz_id.in_([q.id for q in quizzes]))
+            .group_by(Question.quiz_id)
+        ).all()
+    )
+    for q in quizzes:
+        q.question_count = counts.get(q.id, 0)
+    return quizzes
+
+
+def _keyset_page(query, after_created_at: Optional[datetime], after_id: Optional[int], limit: Optional[int]) -> List[Quiz]:
+    """
+    Apply keyset pagination to a Quiz query. Clients resume from the last
+    row they saw via (after_created_at, after_id); a row comparison on the
+    (created_at, id) index walks straight to the page, where OFFSET would
+    scan and throw away every preceding row. With no params the full list
+    comes back, as before.
+    """
+    query = query.order_by(Quiz.created_at.desc(), Quiz.id.desc())
+    if after_created_at is not None and after_id is not None:
+        query = query.filter(tuple_(Quiz.created_at, Quiz.id) < (after_created_at, after_id))
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
 # -----------------------
 # Endpoints
 # -----------------------
 
 @router.get("/my", response_model=List[QuizOut])
-def get_my_quizzes(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_my_quizzes(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    after_created_at: Optional[datetime] = Query(None),
+    after_id: Optional[int] = Query(None),
+):
     """
     Return quizzes created by the current teacher (most recent first).
     Endpoint: GET /api/v1/quizzes/my
@@ -155,35 +296,44 @@ def get_my_quizzes(current_user: User = Depends(get_current_user), db: Session =
     if not current_user or getattr(current_user, "role", "").lower() != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can access this endpoint")
 
-    quizzes = db.query(Quiz).filter(Quiz.creator_id == current_user.id).order_by(Quiz.created_at.desc()).all()
-    return quizzes
+    query = db.query(Quiz).filter(Quiz.creator_id == current_user.id)
+    quizzes = _keyset_page(query, after_created_at, after_id, limit)
+    return _adapter_response(_QUIZ_LIST_ADAPTER, _attach_question_counts(db, quizzes))
 
 
 @router.get("/", response_model=List[QuizOut])
-def list_ready_quizzes(db: Session = Depends(get_db)):
-    quizzes = db.query(Quiz).filter(Quiz.status == QuizStatusEnum.ready).order_by(Quiz.created_at.desc()).all()
-    return quizzes
+def list_ready_quizzes(
+    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    after_created_at: Optional[datetime] = Query(None),
+    after_id: Optional[int] = Query(None),
+):
+    query = db.query(Quiz).filter(Quiz.status == QuizStatusEnum.ready.value)
+    quizzes = _keyset_page(query, after_created_at, after_id, limit)
+    return _adapter_response(_QUIZ_LIST_ADAPTER, _attach_question_counts(db, quizzes))
 
 
 @router.get("/{quiz_id}", response_model=QuizDetail)
 def get_quiz_detail(quiz_id: int, current_user: Optional[User] = Depends(get_current_user), db: Session = Depends(get_db)):
-    quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
+    # eager-load questions in one extra SELECT instead of lazy-loading them
+    # during QuizDetail serialization
+    quiz = db.query(Quiz).options(selectinload(Quiz.questions)).filter(Quiz.id == quiz_id).first()
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
-    if quiz.status != QuizStatusEnum.ready:
+    if quiz.status != QuizStatusEnum.ready.value:
         if not current_user:
             raise HTTPException(status_code=403, detail="Not authorized to view this quiz")
         if current_user.role.lower() != "teacher" and quiz.creator_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to view this quiz")
-    return quiz
+    return _adapter_response(_QUIZ_DETAIL_ADAPTER, quiz)
 
 
 @router.get("/{quiz_id}/status")
 def get_quiz_status(quiz_id: int, db: Session = Depends(get_db)):
-    quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
+    quiz = db.get(Quiz, quiz_id)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
-    return {"quiz_id": quiz_id, "status": quiz.status.value if hasattr(quiz.status, "value") else str(quiz.status)}
+    return {"quiz_id": quiz_id, "status": quiz.status}
 
 
 @router.post("/generate-from-file", status_code=status.HTTP_201_CREATED)
@@ -216,7 +366,7 @@ def generate_quiz_from_file_endpoint(
             topic=topic,
             description=f"AI-generated from uploaded file(s)",
             difficulty=difficulty,
-            status=QuizStatusEnum.generating,
+            status=QuizStatusEnum.generating.value,
         )
         db.add(quiz)
         db.commit()
@@ -231,13 +381,12 @@ def generate_quiz_from_file_endpoint(
     saved_paths = []
     try:
         for f in files:
-            safe_name = f.filename.replace("..", "_")
+            safe_name = _safe_filename(f.filename)
             dest = os.path.join(quiz_dir, safe_name)
-            with open(dest, "wb") as out_f:
-                shutil.copyfileobj(f.file, out_f)
+            _save_upload(f, dest)
             saved_paths.append(dest)
     except Exception as e:
-        quiz.status = QuizStatusEnum.draft
+        quiz.status = QuizStatusEnum.draft.value
         db.add(quiz)
         db.commit()
         raise HTTPException(status_code=500, detail=f"Failed saving files: {e}")
@@ -251,7 +400,7 @@ def generate_quiz_from_file_endpoint(
         "uploader": current_user.id,
     }
 
-    background_tasks.add_task(_background_generate_quiz_from_files, quiz_id, saved_paths, metadata)
+    _schedule_generation(background_tasks, quiz_id, saved_paths, metadata)
 
     return {"quiz_id": quiz_id, "status": "generating"}
 
@@ -280,19 +429,27 @@ def rebuild_quiz_generation(quiz_id: int, background_tasks: BackgroundTasks, cur
     if not os.path.isdir(teacher_dir):
         raise HTTPException(status_code=400, detail="No uploaded files found for this teacher")
 
-    # pick newest subdirectory (most recently modified)
-    subdirs = [os.path.join(teacher_dir, d) for d in os.listdir(teacher_dir) if os.path.isdir(os.path.join(teacher_dir, d))]
+    # pick newest subdirectory (most recently modified); one scandir pass
+    # gives us is_dir() and mtime from cached dirent data instead of a
+    # listdir + per-entry isdir/getmtime stat storm
+    with os.scandir(teacher_dir) as it:
+        subdirs = [
+            (e.path, e.stat(follow_symlinks=False).st_mtime)
+            for e in it
+            if e.is_dir(follow_symlinks=False)
+        ]
     if not subdirs:
         raise HTTPException(status_code=400, detail="No upload folders found for this teacher")
 
     # sort by modification time desc
-    subdirs.sort(key=lambda p: os.path.getmtime(p), reverse=True)
+    subdirs.sort(key=lambda entry: entry[1], reverse=True)
 
     # find the best candidate folder that contains PDFs
     candidate = None
     candidate_files = []
-    for d in subdirs:
-        pdfs = glob.glob(os.path.join(d, "*.pdf"))
+    for d, _mtime in subdirs:
+        with os.scandir(d) as it:
+            pdfs = [e.path for e in it if e.is_file() and e.name.endswith(".pdf")]
         if pdfs:
             candidate = d
             candidate_files = pdfs
@@ -302,12 +459,12 @@ def rebuild_quiz_generation(quiz_id: int, background_tasks: BackgroundTasks, cur
         raise HTTPException(status_code=400, detail="No uploaded PDF files found for this teacher's folders")
 
     # Update quiz status and schedule re-generation using the found files
-    quiz.status = QuizStatusEnum.generating
+    quiz.status = QuizStatusEnum.generating.value
     db.add(quiz)
     db.commit()
 
     # Schedule the background job
-    background_tasks.add_task(_background_generate_quiz_from_files, quiz_id, candidate_files, {
+    _schedule_generation(background_tasks, quiz_id, candidate_files, {
         "title": quiz.title,
         "topic": quiz.topic,
         "num_questions": 10,
@@ -1,5 +1,7 @@
 # app/api/v1/users.py
 from fastapi import APIRouter, Depends
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app import models
@@ -8,6 +10,16 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 @router.get("/", response_model=list[dict])
 def list_users(db: Session = Depends(get_db)):
-    users = db.query(models.User).all()
-    # minimal serialization
-    return [{"id": u.id, "email": u.email, "full_name": u.full_name, "is_active": u.is_active, "role": u.role} for u in users]
+    # Core select of just the serialized columns — skips ORM instrumentation
+    # (identity map, attribute descriptors) since the rows are thrown away
+    # right after serialization.
+    rows = db.execute(
+        select(
+            models.User.id,
+            models.User.email,
+            models.User.full_name,
+            models.User.is_active,
+            models.User.role,
+        )
+    ).all()
+    return ORJSONResponse([dict(r._mapping) for r in rows])
@@ -45,6 +45,12 @@ if not DATABASE_URL:
 REDIS_URL = _env.get("REDIS_URL", "redis://127.0.0.1:6379/0")
 JWT_SECRET = _env.get("JWT_SECRET")  # optional
 
+# Deployment environment; "dev" keeps conveniences like create_all on boot.
+ENV = _env.get("ENV", "dev")
+# Set by the container entrypoint once migrations have run, so workers can
+# skip the schema check entirely.
+SCHEMA_READY = _env.get("SCHEMA_READY", "0").lower() in ("1", "true", "yes")
+
 
 # For compatibility with the rest of the code that expects a Settings object,
 # provide a tiny class with attributes. We purposely do NOT require pydantic here
@@ -53,6 +59,8 @@ class SimpleSettings:
     DATABASE_URL = DATABASE_URL
     REDIS_URL = REDIS_URL
     JWT_SECRET = JWT_SECRET
+    ENV = ENV
+    SCHEMA_READY = SCHEMA_READY
 
 
 settings = SimpleSettings()
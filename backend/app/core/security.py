@@ -1,37 +1,60 @@
 # app/core/security.py
 import hashlib
+
 import bcrypt
+from argon2 import PasswordHasher
+
+# argon2id parameters roughly tuned for interactive login latency.
+# Raise time_cost/memory_cost for more attacker resistance at the price of
+# slower logins.
+_ph = PasswordHasher(time_cost=2, memory_cost=19 * 1024, parallelism=1)
 
 
 def _pre_hash_bytes(password: str) -> bytes:
     """Return the raw SHA-256 digest bytes for the provided password.
 
-    We use the raw digest (32 bytes) to ensure the input to bcrypt is always
-    <= 72 bytes. Using the raw digest preserves entropy and is deterministic
-    so verification can re-compute it.
+    Only needed to verify legacy bcrypt hashes, which limited input to
+    72 bytes. New argon2id hashes take the password directly.
     """
     return hashlib.sha256(password.encode("utf-8", errors="ignore")).digest()
 
 
 def hash_password(password: str) -> str:
-    """Hash a plain password, returning a bcrypt hash string.
+    """Hash a plain password, returning an argon2id hash string.
 
-    The password is pre-hashed (SHA-256) and then passed to bcrypt.hashpw.
-    Using bcrypt.hashpw directly avoids passlib backend detection issues and
-    the 72-byte limitation for long input strings.
+    argon2id is memory-hard (GPU/ASIC resistant) and has no input-length
+    limitation, so no SHA-256 pre-hash step is required.
     """
-    pre = _pre_hash_bytes(password)
-    hashed = bcrypt.hashpw(pre, bcrypt.gensalt())
-    return hashed.decode("utf-8")
+    return _ph.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a plain password against a stored bcrypt hash.
+    """Verify a plain password against a stored hash.
+
+    Handles current argon2id hashes plus legacy bcrypt rows (recognised by
+    the "$2" prefix) created before the argon2 switch.
+    """
+    if hashed_password.startswith("$2"):
+        pre = _pre_hash_bytes(plain_password)
+        try:
+            return bcrypt.checkpw(pre, hashed_password.encode("utf-8"))
+        except Exception:
+            return False
+    try:
+        return _ph.verify(hashed_password, plain_password)
+    except Exception:
+        return False
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Return True when a stored hash should be upgraded on next login.
 
-    We pre-hash the candidate and use bcrypt.checkpw to verify.
+    Legacy bcrypt rows always need upgrading; argon2 rows need it when the
+    hasher parameters have been raised since the hash was written.
     """
-    pre = _pre_hash_bytes(plain_password)
+    if hashed_password.startswith("$2"):
+        return True
     try:
-        return bcrypt.checkpw(pre, hashed_password.encode("utf-8"))
+        return _ph.check_needs_rehash(hashed_password)
     except Exception:
         return False
@@ -3,8 +3,21 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
 
-# Create SQLAlchemy engine from DATABASE_URL
-engine = create_engine(settings.DATABASE_URL, echo=False, future=True)
+# Create SQLAlchemy engine from DATABASE_URL.
+# Pool sized for concurrent FastAPI workers (defaults are 5/10 and exhaust
+# under request spikes); pre_ping drops stale connections before use and
+# recycle stays under MySQL's wait_timeout so we never pay a failed-query
+# reconnect.
+engine = create_engine(
+    settings.DATABASE_URL,
+    echo=False,
+    future=True,
+    pool_size=20,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+)
 
 # Session factory
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
@@ -14,6 +27,15 @@ Base = declarative_base()
 
 
 def get_db():
+    """
+    Yield a request-scoped Session.
+
+    Deliberately synchronous: the stack runs MySQL via mysqlconnector and
+    every route handler is a plain `def`, so FastAPI executes them (and this
+    dependency) on the Starlette threadpool — DB roundtrips never block the
+    event loop. Moving to AsyncSession only pays off together with an async
+    driver (e.g. asyncmy) and `async def` rewrites of all routers.
+    """
     db = SessionLocal()
     try:
         yield db
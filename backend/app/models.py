@@ -1,6 +1,6 @@
 # backend/app/models.py
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Enum, ForeignKey
+from sqlalchemy import CheckConstraint, Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, backref
 from app.db.session import Base
@@ -39,10 +39,18 @@ class Quiz(Base):
     title = Column(String(255), nullable=False)
     topic = Column(Text, nullable=True)
     description = Column(Text, nullable=True)
-    status = Column(Enum(QuizStatusEnum), default=QuizStatusEnum.draft)
+    # stored as a plain string (like User.role) so adding a status never
+    # needs an ALTER of a MySQL ENUM type; the CHECK keeps writes honest
+    status = Column(String(20), default=QuizStatusEnum.draft.value)
     difficulty = Column(String(20), default="any")
     created_at = Column(DateTime, server_default=func.now())
 
+    __table_args__ = (
+        CheckConstraint("status IN ('draft', 'generating', 'ready')", name="ck_quizzes_status"),
+        # backs the keyset pagination in the list endpoints
+        Index("ix_quizzes_created_id", "created_at", "id"),
+    )
+
     creator = relationship("User", back_populates="quizzes")
     questions = relationship("Question", back_populates="quiz", cascade="all, delete-orphan")
 
@@ -52,7 +60,7 @@ class Quiz(Base):
 class Question(Base):
     __tablename__ = "questions"
     id = Column(Integer, primary_key=True, index=True)
-    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False, index=True)
     text = Column(Text, nullable=False)
     option_a = Column(Text)
     option_b = Column(Text)
@@ -70,6 +78,12 @@ class Question(Base):
 
 class EmailOTP(Base):
     __tablename__ = "email_otps"
+    __table_args__ = (
+        # throttle fallback: email + created_at range scan
+        Index("ix_email_otp_email_created", "email", "created_at"),
+        # verify: email + used + expires_at lookup
+        Index("ix_email_otp_email_used_exp", "email", "used", "expires_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
@@ -83,10 +97,14 @@ class EmailOTP(Base):
 
 class Response(Base):
     __tablename__ = "responses"
+    __table_args__ = (
+        # submit/grade queries filter by (user, quiz)
+        Index("ix_responses_user_quiz", "user_id", "quiz_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False)
-    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False, index=True)
     chosen_option = Column(String(1), nullable=False)  # 'a','b','c','d'
     is_correct = Column(Boolean, default=False)
     created_at = Column(DateTime, server_default=func.now())
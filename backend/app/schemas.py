@@ -45,6 +45,8 @@ class QuizOut(BaseModel):
     difficulty: Optional[str]
     status: Optional[str] = None
     created_at: Optional[datetime] = None
+    # populated by list endpoints via a grouped count query; not a column
+    question_count: Optional[int] = None
 
     model_config = ConfigDict(from_attributes=True)
 
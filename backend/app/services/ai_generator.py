@@ -1,8 +1,11 @@
 # app/services/ai_generator.py
+import hashlib
+import io
 import os
 import json
 import re
 import tempfile
+from functools import lru_cache
 from typing import List, Dict, Optional
 
 # Try to import Gemini client if available
@@ -11,11 +14,28 @@ try:
 except Exception:
     genai = None
 
-# PDF text extraction (optional - PyPDF2)
+# orjson decodes the 10-50KB LLM payloads ~2-3x faster than stdlib json
 try:
-    from PyPDF2 import PdfReader
+    import orjson
 except Exception:
-    PdfReader = None
+    orjson = None
+
+# Redis result cache for repeated generation requests (optional)
+try:
+    import redis as redis_lib
+except Exception:
+    redis_lib = None
+
+# PDF text extraction (optional). pypdf is the maintained successor to
+# PyPDF2 and roughly 2x faster at extract_text(); keep PyPDF2 as a fallback
+# for environments that still have only the old package.
+try:
+    from pypdf import PdfReader
+except Exception:
+    try:
+        from PyPDF2 import PdfReader
+    except Exception:
+        PdfReader = None
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
@@ -25,52 +45,155 @@ OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")  # default
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "mistral")  # local model name for Ollama
 USE_OLLAMA_FALLBACK = os.environ.get("USE_OLLAMA_FALLBACK", "1").lower() in ("1", "true", "yes")
 
+REDIS_URL = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0")
+QUIZ_GEN_CACHE_TTL = int(os.environ.get("QUIZ_GEN_CACHE_TTL_SECONDS", 86400))
+
 if genai and GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
 
+# Build the generation config once; it never varies between calls.
+_GEMINI_GEN_CONFIG = (
+    genai.types.GenerationConfig(temperature=0.15, max_output_tokens=1500) if genai else None
+)
+
+
+@lru_cache(maxsize=8)
+def _get_gemini_client(model: str):
+    """Memoize GenerativeModel instances by model name — constructing one
+    per call rebuilds the client and its config objects needlessly."""
+    return genai.GenerativeModel(model)
+
 
 # -------------------- helpers --------------------
+_FENCED_JSON_RE = re.compile(r"```(?:json)?\s*([\[\{].*[\]\}])\s*```", re.S)
+_BARE_JSON_RE = re.compile(r"([\[\{].*[\]\}])", re.S)
+
+
+def _find_json_span(text: str) -> Optional[str]:
+    """
+    Single-pass scan for the first balanced {...} or [...] block, tracking
+    bracket depth and string/escape state. Linear in the input, unlike the
+    greedy DOTALL regexes which can rescan a 50 KB response many times.
+    """
+    start = text.find("[")
+    brace = text.find("{")
+    if start == -1 or (brace != -1 and brace < start):
+        start = brace
+    if start == -1:
+        return None
+
+    stack = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append(ch)
+        elif ch in "]}":
+            if not stack:
+                return None
+            opener = stack.pop()
+            if (opener == "[") != (ch == "]"):
+                return None
+            if not stack:
+                return text[start:i + 1]
+    return None
+
+
 def _extract_json_from_text(text: str) -> Optional[str]:
     """Robustly extract a JSON object/array from text output."""
-    # prefer fenced JSON blocks
-    m = re.search(r"```(?:json)?\s*([\[\{].*[\]\}])\s*```", text, flags=re.S)
-    if m:
-        return m.group(1)
-    # otherwise take first {...} or [...] block
-    m2 = re.search(r"([\[\{].*[\]\}])", text, flags=re.S)
+    # fenced blocks first: prose ahead of the fence can contain a balanced
+    # brace pair of its own (e.g. "{difficulty}") that the scanner would
+    # latch onto instead of the payload
+    if "```" in text:
+        m = _FENCED_JSON_RE.search(text)
+        if m:
+            return m.group(1)
+    span = _find_json_span(text)
+    if span is not None:
+        # a balanced pair is not necessarily the payload; only trust the
+        # span if it parses (repairs included), otherwise fall through
+        try:
+            _safe_parse_json(span)
+        except RuntimeError:
+            pass
+        else:
+            return span
+    # greedy regex fallback for responses the scanner can't balance (e.g.
+    # stray brackets in prose before the payload)
+    m2 = _BARE_JSON_RE.search(text)
     if m2:
         return m2.group(1)
     return None
 
 
+def _loads(js: str):
+    """Decode JSON with orjson when available, stdlib json otherwise."""
+    if orjson is not None:
+        return orjson.loads(js)
+    return json.loads(js)
+
+
+# trailing comma before a closing bracket/brace — the most common LLM defect
+_TRAILING_COMMA_RE = re.compile(r",\s*([\]\}])")
+
+# valid correct_option letters
+_ABCD = frozenset("abcd")
+
+
 def _safe_parse_json(js: str):
     """Try to parse JSON with a few heuristics to fix minor issues."""
     try:
-        return json.loads(js)
-    except Exception:
-        # common fixes
+        return _loads(js)
+    except Exception as e:
+        # repair only after a clean parse fails: the comma regex cannot see
+        # string literals, so running it on valid JSON would mangle payload
+        # text that happens to contain ",]" or ",}"
+        fixed = _TRAILING_COMMA_RE.sub(r"\1", js)
         try:
-            fixed = js.replace("'", '"')
-            return json.loads(fixed)
+            return _loads(fixed)
         except Exception:
+            pass
+        # single-quoted strings (orjson is strict, so this fix matters);
+        # only retry when a quote is actually present
+        if "'" in fixed:
             try:
-                fixed2 = re.sub(r",\s*([\]\}])", r"\1", js)  # trailing commas
-                return json.loads(fixed2)
-            except Exception as e:
-                raise RuntimeError(f"Failed to parse JSON: {e}")
+                return _loads(fixed.replace("'", '"'))
+            except Exception:
+                pass
+        raise RuntimeError(f"Failed to parse JSON: {e}")
 
 
 # -------------------- PDF extraction --------------------
-def extract_text_from_pdf(path: str) -> str:
-    """Extract text from a PDF using PyPDF2 (if available)."""
+def extract_text_from_pdf(path: str, max_chars: int = 12000) -> str:
+    """Extract up to max_chars of text from a PDF using PyPDF2 (if available).
+
+    Only the first max_chars survive the prompt truncation downstream, so
+    stop extracting as soon as the cap is reached instead of materializing a
+    multi-hundred-page document just to throw most of it away.
+    """
     if not PdfReader:
-        raise RuntimeError("PyPDF2 is not installed. Install with: pip install PyPDF2")
+        raise RuntimeError("pypdf is not installed. Install with: pip install pypdf")
     try:
         reader = PdfReader(path)
-        pages = []
+        buf = io.StringIO()
         for p in reader.pages:
-            pages.append(p.extract_text() or "")
-        return "\n\n".join(pages)
+            if buf.tell() >= max_chars:
+                break
+            if buf.tell():
+                buf.write("\n\n")
+            buf.write(p.extract_text() or "")
+        return buf.getvalue()[:max_chars]
     except Exception as e:
         raise RuntimeError(f"Failed to read PDF: {e}")
 
@@ -81,14 +204,11 @@ def _call_gemini(system: str, user: str, model: Optional[str] = None) -> str:
         raise RuntimeError("Gemini SDK not configured. Set GEMINI_API_KEY or use Ollama fallback.")
     model = model or GEMINI_MODEL
     try:
-        client = genai.GenerativeModel(model)
+        client = _get_gemini_client(model)
         prompt = f"{system}\n\n{user}"
         response = client.generate_content(
             prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.15,
-                max_output_tokens=1500,
-            ),
+            generation_config=_GEMINI_GEN_CONFIG,
         )
         if response and response.text:
             return response.text
@@ -98,19 +218,35 @@ def _call_gemini(system: str, user: str, model: Optional[str] = None) -> str:
 
 
 # -------------------- Ollama (local) implementation --------------------
+_ollama_session = None
+
+def _get_ollama_session():
+    """Lazily build a shared requests.Session so repeated Ollama calls reuse
+    the same kept-alive TCP connection instead of handshaking each time."""
+    global _ollama_session
+    if _ollama_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=10)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _ollama_session = session
+    return _ollama_session
+
+
 def _call_ollama(prompt: str, model: Optional[str] = None) -> str:
     """
     Call a local Ollama server at OLLAMA_HOST.
     Expects Ollama to be running (ollama serve).
     Response handling differs between Ollama versions; we try sensible defaults.
     """
-    import requests
-
     model = model or OLLAMA_MODEL
     url = f"{OLLAMA_HOST}/api/generate"
     payload = {"model": model, "prompt": prompt}
     try:
-        r = requests.post(url, json=payload, timeout=60)
+        r = _get_ollama_session().post(url, json=payload, timeout=60)
         r.raise_for_status()
         data = r.json()
         # Ollama's JSON shape may vary; try common keys
@@ -131,6 +267,48 @@ def _call_ollama(prompt: str, model: Optional[str] = None) -> str:
         raise RuntimeError(f"Ollama call failed: {e}")
 
 
+# -------------------- generation result cache --------------------
+_redis_client = None
+
+def _get_redis():
+    global _redis_client
+    if _redis_client is None and redis_lib is not None:
+        _redis_client = redis_lib.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+
+def _generation_cache_key(title, topic, difficulty, num_questions, source_text, model_override=None) -> str:
+    """Content-hash key: at temperature 0.15 identical inputs are common in
+    classroom use (same upload, retried generations), so the LLM answer is
+    worth reusing for a day. The model is part of the key — regenerating
+    with a different model must not serve another model's answer."""
+    source_digest = hashlib.sha256((source_text or "").encode("utf-8", errors="ignore")).hexdigest()
+    material = f"{title}|{topic}|{difficulty}|{num_questions}|{model_override or ''}|{source_digest}".encode("utf-8")
+    return "quiz:gen:" + hashlib.blake2b(material, digest_size=16).hexdigest()
+
+
+def _generation_cache_get(key: str):
+    try:
+        client = _get_redis()
+        if client is not None:
+            cached = client.get(key)
+            if cached:
+                return _loads(cached)
+    except Exception:
+        pass  # cache failure must never break generation
+    return None
+
+
+def _generation_cache_set(key: str, out: List[Dict]) -> None:
+    try:
+        client = _get_redis()
+        if client is not None:
+            payload = orjson.dumps(out) if orjson else json.dumps(out).encode("utf-8")
+            client.setex(key, QUIZ_GEN_CACHE_TTL, payload)
+    except Exception:
+        pass
+
+
 # -------------------- Main generator --------------------
 def generate_quiz_with_openai(
     title: str,
@@ -144,6 +322,11 @@ def generate_quiz_with_openai(
     Produce a list of question dicts. Uses Gemini if API key present; otherwise tries Ollama.
     Each question dict: {text, option_a, option_b, option_c, option_d, correct_option, explanation}
     """
+    cache_key = _generation_cache_key(title, topic, difficulty, num_questions, source_text, model_override)
+    cached = _generation_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     system_prompt = (
         "You are an expert exam writer and pedagogue. Produce EXACTLY a single JSON array of multiple-choice questions only — no commentary, no markdown fences, no extra text. "
         "Each array item must be a JSON object with keys: text, option_a, option_b, option_c, option_d, correct_option, explanation. "
@@ -192,37 +375,27 @@ def generate_quiz_with_openai(
     if not isinstance(parsed, list):
         raise RuntimeError("AI returned JSON but it is not a list")
 
-    # Normalize items
+    # Normalize items: one strip per field, no intermediate dict
     out = []
     for item in parsed:
         if not isinstance(item, dict):
             continue
-        text = item.get("text") or ""
-        opts = {
-            "option_a": item.get("option_a") or item.get("a") or "",
-            "option_b": item.get("option_b") or item.get("b") or "",
-            "option_c": item.get("option_c") or item.get("c") or "",
-            "option_d": item.get("option_d") or item.get("d") or "",
-        }
-        corr = (item.get("correct_option") or item.get("answer") or "").strip().lower()
-        explanation = item.get("explanation") or ""
-
-        if corr not in ("a", "b", "c", "d"):
-            corr = corr[:1] if corr and corr[0] in "abcd" else "a"
-
+        corr = (item.get("correct_option") or item.get("answer") or "").strip().lower()[:1]
         out.append({
-            "text": text.strip(),
-            "option_a": opts["option_a"].strip(),
-            "option_b": opts["option_b"].strip(),
-            "option_c": opts["option_c"].strip(),
-            "option_d": opts["option_d"].strip(),
-            "correct_option": corr,
-            "explanation": explanation.strip(),
+            "text": (item.get("text") or "").strip(),
+            "option_a": (item.get("option_a") or item.get("a") or "").strip(),
+            "option_b": (item.get("option_b") or item.get("b") or "").strip(),
+            "option_c": (item.get("option_c") or item.get("c") or "").strip(),
+            "option_d": (item.get("option_d") or item.get("d") or "").strip(),
+            "correct_option": corr if corr in _ABCD else "a",
+            "explanation": (item.get("explanation") or "").strip(),
         })
 
     # Trim to requested number
     if len(out) > num_questions:
         out = out[:num_questions]
+
+    _generation_cache_set(cache_key, out)
     return out
 
 
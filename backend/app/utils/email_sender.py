@@ -17,6 +17,11 @@ from email.message import EmailMessage
 from pathlib import Path
 from typing import Optional
 
+try:
+    import aiosmtplib
+except Exception:
+    aiosmtplib = None
+
 MAIL_FROM = os.environ.get("MAIL_FROM") or os.environ.get("SMTP_USER")
 MAIL_SERVER = os.environ.get("MAIL_SERVER", "smtp.gmail.com")
 MAIL_PORT = int(os.environ.get("MAIL_PORT", 587))
@@ -35,6 +40,16 @@ def _write_dev_log(email: str, otp: str):
     except Exception as e:
         print("Failed to write OTP to otp_logs.txt:", e)
 
+def _build_otp_message(email: str, otp: str, subject: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = MAIL_FROM or SMTP_USER
+    msg["To"] = email
+    msg.set_content(
+        f"Your SmartQuiz verification code is: {otp}\nThis code will expire in a few minutes."
+    )
+    return msg
+
 def send_email_otp(email: str, otp: str, subject: Optional[str] = None) -> None:
     """
     Send an OTP to the specified email.
@@ -42,7 +57,6 @@ def send_email_otp(email: str, otp: str, subject: Optional[str] = None) -> None:
     Raises exceptions for SMTP failures to make debugging easier.
     """
     subject = subject or "Your SmartQuiz OTP"
-    body = f"Your SmartQuiz verification code is: {otp}\nThis code will expire in a few minutes."
 
     # If SMTP credentials are missing, fallback to dev behavior
     if not SMTP_USER or not SMTP_PASS:
@@ -51,11 +65,7 @@ def send_email_otp(email: str, otp: str, subject: Optional[str] = None) -> None:
         return
 
     # Prepare message
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = MAIL_FROM or SMTP_USER
-    msg["To"] = email
-    msg.set_content(body)
+    msg = _build_otp_message(email, otp, subject)
 
     # Connect and send
     try:
@@ -83,3 +93,38 @@ def send_email_otp(email: str, otp: str, subject: Optional[str] = None) -> None:
     except Exception as e:
         print(f"[ERROR] Unexpected error when sending OTP to {email}: {e}")
         raise
+
+async def send_email_otp_async(email: str, otp: str, subject: Optional[str] = None) -> None:
+    """
+    Async variant of send_email_otp using aiosmtplib, for in-process
+    background sends: the 0.5-1.5s SMTP handshake awaits on the event loop
+    instead of occupying a threadpool worker. The sync version stays for the
+    RQ worker path. Falls back to the sync sender when aiosmtplib is not
+    installed.
+    """
+    subject = subject or "Your SmartQuiz OTP"
+
+    if not SMTP_USER or not SMTP_PASS:
+        print(f"[DEV] No SMTP credentials configured. OTP for {email}: {otp}")
+        _write_dev_log(email, otp)
+        return
+
+    if aiosmtplib is None:
+        send_email_otp(email, otp, subject)
+        return
+
+    msg = _build_otp_message(email, otp, subject)
+    try:
+        await aiosmtplib.send(
+            msg,
+            hostname=MAIL_SERVER,
+            port=MAIL_PORT,
+            username=SMTP_USER,
+            password=SMTP_PASS,
+            use_tls=MAIL_SSL_TLS,
+            start_tls=MAIL_STARTTLS and not MAIL_SSL_TLS,
+        )
+        print(f"[INFO] OTP email sent to {email}")
+    except Exception as e:
+        print(f"[ERROR] Async SMTP send to {email} failed: {e}")
+        raise
@@ -0,0 +1,50 @@
+import pytest
+
+from app.services.ai_generator import (
+    _extract_json_from_text,
+    _find_json_span,
+    _safe_parse_json,
+)
+
+
+def test_find_json_span_bare_array():
+    assert _find_json_span('noise before [{"a": 1}, {"b": 2}] noise after') == '[{"a": 1}, {"b": 2}]'
+
+
+def test_find_json_span_nested_and_strings():
+    # brackets inside strings must not confuse the matcher
+    text = 'x {"k": "va]ue", "list": [1, {"deep": "}"}]} y'
+    assert _find_json_span(text) == '{"k": "va]ue", "list": [1, {"deep": "}"}]}'
+
+
+def test_find_json_span_unbalanced_returns_none():
+    assert _find_json_span("only an opener [ with no close") is None
+    assert _find_json_span("no json at all") is None
+
+
+def test_extract_json_from_fenced_block():
+    text = 'Here you go:\n```json\n[{"text": "q1"}]\n```\nthanks'
+    assert _extract_json_from_text(text) == '[{"text": "q1"}]'
+
+
+def test_extract_json_prefers_fence_over_prose_braces():
+    # a balanced-but-not-JSON pair in the prose must not shadow the payload
+    text = 'Note: {difficulty} was honored.\n```json\n[{"text": "q1"}]\n```'
+    assert _extract_json_from_text(text) == '[{"text": "q1"}]'
+
+
+def test_safe_parse_json_repairs_common_issues():
+    assert _safe_parse_json('[{"a": 1}]') == [{"a": 1}]
+    # single quotes and trailing commas are typical LLM output defects
+    assert _safe_parse_json("[{'a': 1}]") == [{"a": 1}]
+    assert _safe_parse_json('[{"a": 1},]') == [{"a": 1}]
+
+
+def test_safe_parse_json_leaves_valid_strings_alone():
+    # ",]" inside a string literal must survive the trailing-comma repair
+    assert _safe_parse_json('{"a": "x ,] y"}') == {"a": "x ,] y"}
+
+
+def test_safe_parse_json_raises_on_garbage():
+    with pytest.raises(RuntimeError):
+        _safe_parse_json("not json at all")
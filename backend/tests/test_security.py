@@ -1,3 +1,6 @@
+import hashlib
+
+import bcrypt
 import pytest
 
 from app.core import security
@@ -16,3 +19,15 @@ def test_verify_wrong_password():
     hashed = security.hash_password(pw)
     # wrong candidate must fail
     assert security.verify_password("not-the-right-one", hashed) is False
+
+
+def test_verify_legacy_bcrypt_hash():
+    # rows hashed before the argon2 switch used sha256-pre-hashed bcrypt
+    pw = "legacy password"
+    pre = hashlib.sha256(pw.encode("utf-8")).digest()
+    legacy = bcrypt.hashpw(pre, bcrypt.gensalt()).decode("utf-8")
+    assert security.verify_password(pw, legacy) is True
+    assert security.verify_password("wrong", legacy) is False
+    # legacy rows must be flagged for lazy upgrade on login
+    assert security.needs_rehash(legacy) is True
+    assert security.needs_rehash(security.hash_password(pw)) is False